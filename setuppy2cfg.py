@@ -1,58 +1,198 @@
 import argparse
 import ast
-import inspect
+import contextlib
+import io
+import os
 import sys
 
-import textwrap
-from collections import defaultdict
-from copy import deepcopy
-
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 
 def warn(msg):
     print("***", msg, file=sys.stderr)
 
 
-def call_to_args(call: ast.Call, func) -> Dict[str, Any]:
+def fast_literal(node: ast.AST) -> Any:
+    """
+    `ast.literal_eval` with fast paths for the constants and containers setup.py is made of.
+    """
+    t = type(node)
+    if t is ast.Constant:
+        return node.value
+    if t is ast.List:
+        return [fast_literal(elt) for elt in node.elts]
+    if t is ast.Tuple:
+        return tuple(fast_literal(elt) for elt in node.elts)
+    if t is ast.Dict and None not in node.keys:
+        return {
+            fast_literal(key): fast_literal(value)
+            for key, value in zip(node.keys, node.values)
+        }
+    return ast.literal_eval(node)
+
+
+FIND_PACKAGES_PARAMS = ("where", "exclude", "include")
+
+
+def find_packages_args(call: ast.Call) -> Dict[str, Any]:
+    """
+    Take an AST call and bind its args + kwargs to the parameters of `setuptools.find_packages`.
+    """
+    if len(call.args) > len(FIND_PACKAGES_PARAMS):
+        raise TypeError("too many positional arguments to find_packages()")
+    args = {}
+    for name, arg in zip(FIND_PACKAGES_PARAMS, call.args):
+        args[name] = fast_literal(arg)
+    for kw in call.keywords:
+        if kw.arg not in FIND_PACKAGES_PARAMS:
+            raise TypeError(f"unexpected keyword argument {kw.arg!r} to find_packages()")
+        if kw.arg in args:
+            raise TypeError(f"multiple values for argument {kw.arg!r} to find_packages()")
+        args[kw.arg] = fast_literal(kw.value)
+    return args
+
+
+def write_config(
+    config: Dict[str, Dict[str, Any]],
+    warnings: List[str],
+    file=None,
+    *,
+    indent=4,
+) -> None:
+    """
+    Write a setup.cfg style config, followed by the warnings as comments.
+    """
+    if file is None:
+        file = sys.stdout
+    pad = " " * indent
+    nonempty_sections = [(section, data) for section, data in config.items() if data]
+    parts = []
+    for section, data in nonempty_sections:
+        parts.append(f"[{section}]\n")
+        for key, value in data.items():
+            # Values come from literals, so exact type checks suffice.
+            t = type(value)
+            if t is str or t is bool or t is int:
+                parts.append(f"{key} = {value}\n")
+            elif t is list:
+                parts.append(f"{key} =\n")
+                parts.extend(f"{pad}{atom}\n" for atom in value)
+            else:
+                msg = f"Non-serializable value {section}.{key}"
+                warn(msg)
+                parts.append(f"# {msg}\n")
+        parts.append("\n")
+
+    for warning in warnings:
+        parts.append("# " + warning.replace("\n", "\n# ") + "\n")
+    file.write("".join(parts))
+
+
+def iter_calls(tree: ast.AST) -> Iterator[ast.Call]:
     """
-    Take an AST call and interpret its args + kwargs with func.
+    Yield the outermost Call nodes in the tree (without descending into calls).
     """
-    args = [ast.literal_eval(arg) for arg in call.args]
-    kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in call.keywords}
-    return inspect.signature(func).bind(*args, **kwargs).arguments
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Call):
+            yield node
+        else:
+            stack.extend(reversed(list(ast.iter_child_nodes(node))))
 
 
-class Walker(ast.NodeVisitor):
+class Walker:
     metadata_keys = {}
     options_keys = {}
 
     def __init__(self, source: str):
         self.source = source
-        self.output = defaultdict(dict)
+        self.output = {}
         self.warnings = []
+        self._source_lines = None  # split on first use; clean conversions never need it
+        self._seg_cache = {}
+
+    def _segment_from_lines(
+        self, lineno: int, col: int, end_lineno: int, end_col: int
+    ) -> str:
+        """
+        Like `ast.get_source_segment`, but indexes into the pre-split source lines.
+
+        Column offsets are UTF-8 byte offsets, as in the AST.
+        """
+        lines = self._source_lines
+        if lines is None:
+            # Split only on the line endings the tokenizer knows (unlike `str.splitlines`).
+            lines = self._source_lines = io.StringIO(self.source, newline="").readlines()
+        first = lines[lineno - 1].encode()
+        if lineno == end_lineno:
+            return first[col:end_col].decode()
+        parts = [first[col:].decode()]
+        parts.extend(lines[lineno:end_lineno - 1])
+        parts.append(lines[end_lineno - 1].encode()[:end_col].decode())
+        return "".join(parts)
 
     def get_source_segment(self, node: ast.AST) -> str:
-        return ast.get_source_segment(self.source, node)
-
-    def get_value(self, node: ast.AST) -> str:
+        seg = self._seg_cache.get(id(node))
+        if seg is None:
+            seg = self._seg_cache[id(node)] = self._segment_from_lines(
+                node.lineno, node.col_offset, node.end_lineno, node.end_col_offset
+            )
+        return seg
+
+    def _dotted_name(self, node: ast.AST) -> Optional[str]:
+        """
+        Return `a.b.c` for a chain of plain names and attributes, None for anything else.
+        """
+        attrs = []
+        while isinstance(node, ast.Attribute):
+            attrs.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        attrs.append(node.id)
+        return ".".join(reversed(attrs))
+
+    def get_value(self, node: ast.AST, *, dotted_attr: bool = False) -> Any:
+        """
+        Get the value for a keyword; names become `attr:` directives.
+
+        Dotted names (`pkg.__version__`) only do so with `dotted_attr`, i.e. for keys
+        that support `attr:`; otherwise they fall through and fail to evaluate.
+        """
         if isinstance(node, ast.Name):
-            return f"attr:{self.get_source_segment(node)}"
-        return ast.literal_eval(node)
+            return f"attr:{node.id}"
+        if dotted_attr and isinstance(node, ast.Attribute):
+            name = self._dotted_name(node)
+            if name:
+                return f"attr:{name}"
+        return fast_literal(node)
+
+    def _func_name(self, func: ast.AST) -> Optional[str]:
+        if isinstance(func, ast.Attribute):
+            return func.attr
+        if isinstance(func, ast.Name):
+            return func.id
+        return None
+
+    def is_setup_call(self, node: ast.AST) -> bool:
+        if not isinstance(node, ast.Call):
+            return False
+        name = self._func_name(node.func)
+        return bool(name and name.endswith("setup"))
 
-    def visit_Call(self, node: ast.Call):
-        if self.get_source_segment(node.func).endswith("setup"):
-            self.process_setup_call(node)
+    def walk(self, tree: ast.Module) -> None:
+        for node in iter_calls(tree):
+            if self.is_setup_call(node):
+                self.process_setup_call(node)
 
     def process_setup_call(self, node: ast.Call) -> None:
         for kw in node.keywords:
             try:
                 self.process_setup_keyword(kw)
             except Exception as exc:
-                ind_source = textwrap.indent(self.get_source_segment(kw.value), "|  ")
-                self.warn(
-                    f"Unable to get value for {kw.arg}: {exc}\n{ind_source}"
-                )
+                # Formatted lazily by `format_warning` when the output is written.
+                self.warnings.append((kw.arg, kw.value, exc))
 
     def process_setup_keyword(self, kw: ast.keyword) -> None:
         raise NotImplementedError('...')
@@ -60,27 +200,37 @@ class Walker(ast.NodeVisitor):
     def is_find_packages_call(self, node: ast.AST) -> bool:
         if not isinstance(node, ast.Call):
             return False
-        return self.get_source_segment(node.func).endswith("find_packages")
+        name = self._func_name(node.func)
+        return bool(name and name.endswith("find_packages"))
 
     def process_find_packages(self, call: ast.Call) -> str:
-        import setuptools
-
-        fp_args = call_to_args(call, setuptools.find_packages)
+        fp_args = find_packages_args(call)
         where = fp_args.get("where", ".")
         if where != ".":
             raise ValueError(f"Unable to process find_packages(where={where!r}, ...)")
         for key in ("include", "exclude"):
             value = fp_args.get(key)
             if value:
-                self.output["options.packages.find"][key] = list(value)
+                self.output.setdefault("options.packages.find", {})[key] = list(value)
         return "find:"
 
     def get_output(self):
-        return deepcopy(dict(self.output))
-
-    def warn(self, msg):
-        warn(msg)
-        self.warnings.append(msg)
+        # Subclasses only rearrange keys; the values themselves are never mutated.
+        return {section: dict(data) for section, data in self.output.items()}
+
+    def format_warning(self, warning: Tuple[str, ast.AST, Exception]) -> str:
+        arg, node, exc = warning
+        ind_source = "|  " + self.get_source_segment(node).replace("\n", "\n|  ")
+        return f"Unable to get value for {arg}: {exc}\n{ind_source}"
+
+    def emit_warnings(self) -> List[str]:
+        """
+        Format the accumulated warnings, print them to stderr and return them.
+        """
+        messages = [self.format_warning(warning) for warning in self.warnings]
+        for msg in messages:
+            warn(msg)
+        return messages
 
     def write(
         self,
@@ -88,26 +238,7 @@ class Walker(ast.NodeVisitor):
         file,
         indent=4,
     ):
-        config = self.get_output()
-        for section, data in config.items():
-            if not data:
-                continue
-            print(f"[{section}]", file=file)
-            for key, value in data.items():
-                if isinstance(value, (str, bool, int)):
-                    print(f"{key} = {value}", file=file)
-                elif isinstance(value, list):
-                    print(f"{key} =", file=file)
-                    for atom in value:
-                        print(f"{' ' * indent}{atom}", file=file)
-                else:
-                    msg = f"Non-serializable value {section}.{key}"
-                    warn(msg)
-                    print(f"# {msg}", file=file)
-            print(file=file)
-
-        for warning in self.warnings:
-            print(textwrap.indent(warning, "# "), file=file)
+        write_config(self.get_output(), self.emit_warnings(), file=file, indent=indent)
 
 
 class SetupCfgWalker(Walker):
@@ -154,25 +285,31 @@ class SetupCfgWalker(Walker):
         "py_modules": "list-comma",
         "data_files": "section",
     }
+    # Keywords are dispatched through this table, a single probe per keyword
+    # (cheaper than checking the two key dicts in turn).
+    _KEY_TO_SECTION = {
+        **{key: "metadata" for key in metadata_keys},
+        **{key: "options" for key in options_keys},
+    }
+    _ATTR_KEYS = frozenset(
+        key
+        for key, hint in {**metadata_keys, **options_keys}.items()
+        if "attr:" in hint
+    )
 
     def process_setup_keyword(self, kw: ast.keyword) -> None:
         arg = kw.arg
-        output_key = None
-        if arg in self.metadata_keys:
-            output_key = ("metadata", arg)
-        elif arg in self.options_keys:
-            output_key = ("options", arg)
-        if not output_key:
+        output_section = self._KEY_TO_SECTION.get(arg)
+        if output_section is None:
             warn(f"No output mapping for {arg}")
             return
         value = None
-        if output_key == ("options", "packages"):
+        if output_section == "options" and arg == "packages":
             if self.is_find_packages_call(kw.value):
                 value = self.process_find_packages(kw.value)
         if value is None:
-            value = self.get_value(kw.value)
-        output_section, output_key = output_key
-        self.output[output_section][output_key] = value
+            value = self.get_value(kw.value, dotted_attr=arg in self._ATTR_KEYS)
+        self.output.setdefault(output_section, {})[arg] = value
 
     def get_output(self):
         config = super().get_output()
@@ -191,32 +328,124 @@ class PyProjectTomlWalker(Walker):
         indent=4,
     ):
         import tomli_w
+        self.emit_warnings()
         config = self.get_output()
         print(tomli_w.dumps(config), file=file)
 
     def process_setup_keyword(self, kw: ast.keyword) -> None:
         arg = kw.arg
         value = self.get_value(kw.value)
-        self.output["project"][arg] = value
+        self.output.setdefault("project", {})[arg] = value
+
+
+def parse_source(source: str, filename: str) -> ast.Module:
+    return ast.parse(
+        source,
+        filename,
+        mode="exec",
+        type_comments=False,
+        feature_version=sys.version_info[:2],
+    )
+
+
+def convert(source: str, filename: str, *, format: str, file) -> None:
+    parsed = parse_source(source, filename)
+    if format == "setup.cfg":
+        walker = SetupCfgWalker(source)
+    elif format == "pyproject.toml":
+        walker = PyProjectTomlWalker(source)
+    else:
+        raise ValueError(f"Unknown format {format!r}")
+    walker.walk(parsed)
+    walker.write(file=file)
+
+
+def _convert_one(job: Tuple[str, str]) -> Tuple[str, str, str, bool]:
+    """
+    Convert a single file for `convert_batch`, capturing its output and warnings.
+    """
+    path, format = job
+    out = io.StringIO()
+    err = io.StringIO()
+    with contextlib.redirect_stderr(err):
+        try:
+            with open(path) as infp:
+                source = infp.read()
+            convert(source, path, format=format, file=out)
+        except Exception as exc:
+            msg = f"Unable to convert {path}: {exc}"
+            warn(msg)
+            return path, f"# {msg}\n", err.getvalue(), False
+    return path, out.getvalue(), err.getvalue(), True
+
+
+def convert_batch(paths: List[str], *, format: str, jobs: int, file) -> int:
+    """
+    Convert many setup.py files in parallel, writing each output after a header comment.
+
+    Warnings are printed to stderr per file, each line prefixed with the file's path.
+
+    Returns the number of files that could not be converted.
+    """
+    import multiprocessing
+
+    job_list = [(path, format) for path in paths]
+    jobs = min(jobs, len(job_list))
+    # A few chunks per worker, like `Pool.map` does, so small batches still use every worker.
+    chunksize = max(1, len(job_list) // (jobs * 4))
+    failures = 0
+    with multiprocessing.Pool(jobs) as pool:
+        for path, output, messages, ok in pool.imap(
+            _convert_one, job_list, chunksize=chunksize
+        ):
+            file.write(f"# ==> {path} <==\n{output}")
+            sys.stderr.writelines(f"{path}: {line}\n" for line in messages.splitlines())
+            if not ok:
+                failures += 1
+    return failures
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument(
+    inputs = ap.add_mutually_exclusive_group()
+    inputs.add_argument(
         "-i", dest="input", type=argparse.FileType(), required=False, default=sys.stdin
     )
+    inputs.add_argument(
+        "--batch",
+        nargs="+",
+        metavar="PATH",
+        help="convert these setup.py files in parallel instead of the single input",
+    )
     ap.add_argument("--format", choices=("setup.cfg", "pyproject.toml"), default="setup.cfg")
+    ap.add_argument(
+        "-j",
+        dest="jobs",
+        type=positive_int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes for --batch (default: CPU count)",
+    )
     args = ap.parse_args()
-    source = args.input.read()
-    parsed = ast.parse(source, getattr(args.input, "name", str(args.input)))
-    if args.format == "setup.cfg":
-        walker = SetupCfgWalker(source)
-    elif args.format == "pyproject.toml":
-        walker = PyProjectTomlWalker(source)
-    else:
-        raise ValueError(f"Unknown format {args.format!r}")
-    walker.visit(parsed)
-    walker.write(file=sys.stdout)
+    if args.batch:
+        failures = convert_batch(
+            args.batch, format=args.format, jobs=args.jobs, file=sys.stdout
+        )
+        if failures:
+            sys.exit(1)
+        return
+    convert(
+        args.input.read(),
+        getattr(args.input, "name", str(args.input)),
+        format=args.format,
+        file=sys.stdout,
+    )
 
 
 if __name__ == "__main__":